@@ -5,44 +5,120 @@ from typing import List
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 import json
+import hashlib
 
 # ==================== GOOGLE DRIVE SERVICE CODE ====================
 
+# Folder ID patterns. Streamlit re-executes this module on every rerun, so
+# this only saves re's internal cache lookup on each extract_folder_id call.
+# A /folders/ segment wins wherever it appears; otherwise fall back to an
+# ?id= URL or a bare ID (one scan, since a bare ID can't contain '=').
+_FOLDERS_RE = re.compile(r'/folders/([a-zA-Z0-9_-]+)')
+_OTHER_ID_RE = re.compile(r'id=([a-zA-Z0-9_-]+)|^([a-zA-Z0-9_-]+)$')
+
+# Width requested from Drive's thumbnail endpoint for each slide
+SLIDE_WIDTH = 1920
+SLIDE_URL_TEMPLATE = f"https://drive.google.com/thumbnail?id=%s&sz=w{SLIDE_WIDTH}"
+
+# Retries for transient Drive errors (429/5xx), with exponential backoff
+DRIVE_RETRIES = 5
+
+# Listings kept in memory; each one is also pickled to disk until cleared
+LISTING_CACHE_ENTRIES = 16
+
+class _EmptyFolderError(Exception):
+    """Raised by _fetch_images so an empty listing is never cached."""
+
 def extract_folder_id(url: str) -> str:
     """Extract folder ID from Google Drive URL."""
-    patterns = [
-        r'/folders/([a-zA-Z0-9_-]+)',
-        r'id=([a-zA-Z0-9_-]+)',
-        r'^([a-zA-Z0-9_-]+)$'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
+    match = _FOLDERS_RE.search(url) or _OTHER_ID_RE.search(url)
+    if match:
+        return next(group for group in match.groups() if group)
     
     raise ValueError(f"Could not extract folder ID from URL: {url}")
 
-def get_drive_service(credentials_json):
-    """Create Google Drive service using credentials."""
+@st.cache_resource(ttl=3600, show_spinner=False)
+def get_drive_service(credentials_sha: str, _credentials_json: str):
+    """
+    Create Google Drive service using credentials.
+    
+    Cached per credentials fingerprint and evicted after an hour, so the
+    uploaded key is not held for the server's lifetime; the leading
+    underscore keeps the raw JSON out of the cache key.
+    """
     try:
-        credentials_dict = json.loads(credentials_json)
+        credentials_dict = json.loads(_credentials_json)
         credentials = service_account.Credentials.from_service_account_info(
             credentials_dict,
             scopes=['https://www.googleapis.com/auth/drive.readonly']
         )
-        service = build('drive', 'v3', credentials=credentials)
+        service = build(
+            'drive', 'v3', credentials=credentials,
+            cache_discovery=False, static_discovery=True
+        )
         return service
     except Exception as e:
         raise Exception(f"Failed to create Drive service: {str(e)}")
 
-def get_all_images_from_folder(folder_url: str, credentials_json: str) -> List[dict]:
+# Persisted to disk so the listing survives restarts. Streamlit ignores TTLs on
+# persisted caches, so the listing only updates when Force Refresh clears it.
+# max_entries only bounds the in-memory copies; Clear Credentials & Reset
+# deletes the session's pickle from disk.
+@st.cache_data(persist="disk", max_entries=LISTING_CACHE_ENTRIES, show_spinner=False)
+def _fetch_images(folder_id: str, credentials_sha: str, _credentials_json: str) -> List[dict]:
+    """
+    Page through a Drive folder's images.
+    
+    Cached per folder ID and credentials SHA; the leading underscore keeps
+    the raw credentials JSON out of Streamlit's cache key.
+    """
+    service = get_drive_service(credentials_sha, _credentials_json)
+    
+    all_images = []
+    
+    # Query for ALL image files in the folder with pagination
+    query = f"'{folder_id}' in parents and (mimeType contains 'image/') and trashed=false"
+    
+    request = service.files().list(
+        q=query,
+        fields="nextPageToken, files(id, name)",
+        pageSize=1000,  # Max page size
+        orderBy='createdTime'  # Order by creation time
+    )
+    
+    while request is not None:
+        results = request.execute(num_retries=DRIVE_RETRIES)
+        
+        files = results.get('files', [])
+        
+        # Add the whole page to the list in one pass
+        all_images.extend(
+            {
+                'id': file['id'],
+                'name': file.get('name', 'Untitled'),
+                'url': SLIDE_URL_TEMPLATE % file['id']
+            }
+            for file in files
+        )
+        
+        # list_next carries the pageToken over; None when there are no more pages
+        request = service.files().list_next(request, results)
+    
+    # Exceptions aren't cached, so an empty or not-yet-shared folder is
+    # re-listed on the next load instead of staying empty forever
+    if not all_images:
+        raise _EmptyFolderError(folder_id)
+    
+    return all_images
+
+def get_all_images_from_folder(folder_url: str, credentials_json: str, credentials_sha: str) -> List[dict]:
     """
     Get ALL image files from a Google Drive folder with pagination.
     
     Args:
         folder_url: Google Drive folder URL or ID
         credentials_json: Service account credentials JSON
+        credentials_sha: SHA-256 of the uploaded credentials, used as the cache key
         
     Returns:
         List of dicts with image info (id, name, url)
@@ -52,47 +128,13 @@ def get_all_images_from_folder(folder_url: str, credentials_json: str) -> List[d
     except ValueError as e:
         raise ValueError(f"Invalid folder URL: {e}")
     
-    if not credentials_json:
+    if not credentials_json or not credentials_sha:
         raise ValueError("Credentials required")
     
     try:
-        service = get_drive_service(credentials_json)
-        
-        all_images = []
-        page_token = None
-        
-        # Query for ALL image files in the folder with pagination
-        while True:
-            query = f"'{folder_id}' in parents and (mimeType contains 'image/') and trashed=false"
-            
-            results = service.files().list(
-                q=query,
-                fields="nextPageToken, files(id, name, mimeType, createdTime)",
-                pageSize=1000,  # Max page size
-                pageToken=page_token,
-                orderBy='createdTime'  # Order by creation time
-            ).execute()
-            
-            files = results.get('files', [])
-            
-            # Add each file to the list
-            for file in files:
-                file_id = file['id']
-                direct_url = f"https://drive.google.com/uc?export=view&id={file_id}"
-                all_images.append({
-                    'id': file_id,
-                    'name': file.get('name', 'Untitled'),
-                    'url': direct_url,
-                    'mime_type': file.get('mimeType', '')
-                })
-            
-            # Check if there are more pages
-            page_token = results.get('nextPageToken')
-            if not page_token:
-                break
-        
-        return all_images
-        
+        return _fetch_images(folder_id, credentials_sha, credentials_json)
+    except _EmptyFolderError:
+        return []
     except Exception as e:
         raise Exception(f"Error fetching images from Drive: {str(e)}")
 
@@ -106,20 +148,24 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Session state defaults
+SESSION_DEFAULTS = {
+    'credentials': None,
+    'credentials_sha': None,
+    'current_index': 0,
+    'auto_play': True,
+    'images': None,  # Changed to store full image info
+    'credentials_loaded': False,
+    'loading_complete': False,
+    'last_advance': 0.0,
+    'uploader_key': 0
+}
+
 # Initialize ALL session state variables at the start
 def init_session_state():
     """Initialize all session state variables with defaults."""
-    defaults = {
-        'credentials': None,
-        'current_index': 0,
-        'auto_play': True,
-        'images': None,  # Changed to store full image info
-        'credentials_loaded': False,
-        'loading_complete': False
-    }
-    for key, default_value in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = default_value
+    for key, default_value in SESSION_DEFAULTS.items():
+        st.session_state.setdefault(key, default_value)
 
 # Call initialization before any other code
 init_session_state()
@@ -127,40 +173,21 @@ init_session_state()
 # Hardcoded Google Drive folder URL
 FOLDER_URL = "https://drive.google.com/drive/folders/1LfSwuD7WxbS0ZdDeGo0hpiviUx6vMhqs?usp=sharing"
 
-# Custom CSS
-st.markdown("""
-<style>
-    .stImage {
-        display: flex;
-        justify-content: center;
-        align-items: center;
-    }
-    
-    img {
-        max-height: 70vh;
-        object-fit: contain;
-        border-radius: 8px;
-        box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15);
-    }
-    
-    .main-header {
-        text-align: center;
-        padding: 15px;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border-radius: 8px;
-        margin-bottom: 20px;
-    }
-    
-    .image-name {
-        text-align: center;
-        font-size: 14px;
-        color: #666;
-        margin-top: 10px;
-        font-style: italic;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Number of upcoming slides the browser is asked to preload
+PRELOAD_AHEAD = 3
+
+# Custom CSS, stored pre-minified so each rerun ships a small payload without
+# re-processing it
+CUSTOM_CSS = (
+    '<style>'
+    '.stImage { display: flex; justify-content: center; align-items: center; }'
+    'img { max-height: 70vh; object-fit: contain; border-radius: 8px; box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15); }'
+    '.main-header { text-align: center; padding: 15px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; border-radius: 8px; margin-bottom: 20px; }'
+    '.image-name { text-align: center; font-size: 14px; color: #666; margin-top: 10px; font-style: italic; }'
+    '</style>'
+)
+
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # ==================== SIDEBAR ====================
 with st.sidebar:
@@ -178,28 +205,58 @@ with st.sidebar:
         "Upload Service Account JSON",
         type=['json'],
         help="Upload your Google Drive service account credentials file",
-        key='creds_uploader'
+        key=f"creds_uploader_{st.session_state.uploader_key}"
     )
     
     if uploaded_file is not None:
-        try:
-            credentials_json = uploaded_file.read().decode('utf-8')
-            st.session_state.credentials = credentials_json
-            st.session_state.credentials_loaded = True
-            st.session_state.loading_complete = False  # Reset loading flag
+        credentials_bytes = uploaded_file.getvalue()
+        credentials_sha = hashlib.sha256(credentials_bytes).hexdigest()
+        
+        # The uploader keeps its file across reruns; only reload when it changes
+        if credentials_sha != st.session_state.credentials_sha:
+            try:
+                credentials_json = credentials_bytes.decode('utf-8')
+                st.session_state.credentials = credentials_json
+                st.session_state.credentials_sha = credentials_sha
+                st.session_state.credentials_loaded = True
+                st.session_state.loading_complete = False  # Reset loading flag
+            except Exception as e:
+                st.error(f"❌ Error loading credentials: {str(e)}")
+                st.session_state.credentials = None
+                st.session_state.credentials_sha = credentials_sha
+                st.session_state.credentials_loaded = False
+        
+        if st.session_state.credentials_loaded:
             st.success("✅ Credentials loaded!")
-        except Exception as e:
-            st.error(f"❌ Error loading credentials: {str(e)}")
-            st.session_state.credentials = None
-            st.session_state.credentials_loaded = False
     
     # Show status if credentials are loaded
     if st.session_state.get('credentials_loaded', False):
         if st.session_state.images:
             st.info(f"✅ {len(st.session_state.images)} images loaded")
         
+        if st.button("🔄 Force Refresh"):
+            # Only drop this folder/credentials listing, not other sessions'
+            _fetch_images.clear(
+                extract_folder_id(FOLDER_URL),
+                st.session_state.credentials_sha,
+                st.session_state.credentials
+            )
+            st.session_state.loading_complete = False
+            st.session_state.current_index = 0
+            st.rerun()
+        
         if st.button("🗑️ Clear Credentials & Reset"):
+            # Drop this user's cached Drive client so the server no longer holds
+            # the key, and remount the uploader so it doesn't hand the file back
+            get_drive_service.clear(st.session_state.credentials_sha, st.session_state.credentials)
+            _fetch_images.clear(
+                extract_folder_id(FOLDER_URL),
+                st.session_state.credentials_sha,
+                st.session_state.credentials
+            )
+            st.session_state.uploader_key += 1
             st.session_state.credentials = None
+            st.session_state.credentials_sha = None
             st.session_state.credentials_loaded = False
             st.session_state.images = None
             st.session_state.loading_complete = False
@@ -255,13 +312,16 @@ if st.session_state.credentials and not st.session_state.loading_complete:
         try:
             images = get_all_images_from_folder(
                 FOLDER_URL, 
-                st.session_state.credentials
+                st.session_state.credentials,
+                st.session_state.credentials_sha
             )
             if images:
                 st.session_state.images = images
                 st.session_state.loading_complete = True
                 st.success(f"✅ Successfully loaded {len(images)} images!")
                 time.sleep(1)
+                # Start the autoplay clock only once the first slide is about to show
+                st.session_state.last_advance = time.time()
                 st.rerun()
             else:
                 st.warning("⚠️ No images found in folder")
@@ -293,80 +353,113 @@ if total_images == 0:
     st.error("No images found in the folder")
     st.stop()
 
-# Controls
-col1, col2, col3, col4, col5 = st.columns(5)
-
-with col1:
-    if st.button("⏮️ First"):
-        st.session_state.current_index = 0
-        st.rerun()
-
-with col2:
-    if st.button("◀️ Previous"):
-        st.session_state.current_index = (st.session_state.current_index - 1) % total_images
-        st.rerun()
-
-with col3:
-    play_text = "⏸️ Pause" if st.session_state.auto_play else "▶️ Play"
-    if st.button(play_text):
-        st.session_state.auto_play = not st.session_state.auto_play
-        st.rerun()
+# Seconds of timer jitter tolerated before a tick counts as a full interval
+TICK_TOLERANCE = 0.5
 
-with col4:
-    if st.button("▶️ Next"):
+def advance_slide(total_images: int, loop: bool):
+    """Move to the next slide, stopping playback at the end when loop is off."""
+    if loop:
         st.session_state.current_index = (st.session_state.current_index + 1) % total_images
+    elif st.session_state.current_index < total_images - 1:
+        st.session_state.current_index += 1
+    else:
+        st.session_state.auto_play = False
+        # Full rerun so the fragment is re-registered without its timer
         st.rerun()
-
-with col5:
-    if st.button("⏭️ Last"):
-        st.session_state.current_index = total_images - 1
-        st.rerun()
-
-# Progress bar
-progress = (st.session_state.current_index + 1) / total_images
-st.progress(progress, text=f"Image {st.session_state.current_index + 1} of {total_images}")
-
-st.markdown("---")
-
-# Display current image
-current_image = images[st.session_state.current_index]
-current_image_url = current_image['url']
-current_image_name = current_image['name']
-
-col_left, col_center, col_right = st.columns([1, 6, 1])
-
-with col_center:
-    st.image(
-        current_image_url, 
-        use_column_width=True,
-        caption=f"Image {st.session_state.current_index + 1} / {total_images}"
-    )
+    st.session_state.last_advance = time.time()
+
+def go_to_slide(index: int):
+    """Button callback: jump to a slide and restart the auto-advance countdown."""
+    st.session_state.current_index = index
+    st.session_state.last_advance = time.time()
+
+# Only this fragment reruns on each auto-advance tick; the sidebar and
+# loading logic above are left untouched between slides.
+@st.fragment(run_every=slide_interval if st.session_state.auto_play else None)
+def slideshow():
+    """Render the controls, current slide and status bar."""
+    # Auto-advance logic
+    if st.session_state.auto_play:
+        elapsed = time.time() - st.session_state.last_advance
+        if elapsed >= slide_interval - TICK_TOLERANCE:
+            advance_slide(total_images, auto_loop)
     
-    if show_filenames:
-        st.markdown(f'<div class="image-name">📄 {current_image_name}</div>', unsafe_allow_html=True)
-
-# Status info
-info_col1, info_col2, info_col3 = st.columns(3)
-
-with info_col1:
-    status = "▶️ Auto-playing" if st.session_state.auto_play else "⏸️ Paused"
-    st.info(status)
-
-with info_col2:
-    st.info(f"⏱️ {slide_interval}s interval")
-
-with info_col3:
-    st.info(f"🔄 Loop: {'On' if auto_loop else 'Off'}")
+    # Controls
+    col1, col2, col3, col4, col5 = st.columns(5)
+    
+    with col1:
+        st.button("⏮️ First", on_click=go_to_slide, args=(0,))
+    
+    with col2:
+        st.button(
+            "◀️ Previous",
+            on_click=go_to_slide,
+            args=((st.session_state.current_index - 1) % total_images,)
+        )
+    
+    with col3:
+        play_text = "⏸️ Pause" if st.session_state.auto_play else "▶️ Play"
+        if st.button(play_text):
+            st.session_state.auto_play = not st.session_state.auto_play
+            st.session_state.last_advance = time.time()
+            st.rerun()
+    
+    with col4:
+        st.button(
+            "▶️ Next",
+            on_click=go_to_slide,
+            args=((st.session_state.current_index + 1) % total_images,)
+        )
+    
+    with col5:
+        st.button("⏭️ Last", on_click=go_to_slide, args=(total_images - 1,))
+    
+    # Progress bar
+    progress = (st.session_state.current_index + 1) / total_images
+    st.progress(progress, text=f"Image {st.session_state.current_index + 1} of {total_images}")
+    
+    st.markdown("---")
+    
+    # Display current image
+    current_image = images[st.session_state.current_index]
+    current_image_url = current_image['url']
+    current_image_name = current_image['name']
+    
+    col_left, col_center, col_right = st.columns([1, 6, 1])
+    
+    with col_center:
+        st.image(
+            current_image_url, 
+            use_column_width=True,
+            caption=f"Image {st.session_state.current_index + 1} / {total_images}"
+        )
+        
+        if show_filenames:
+            st.markdown(f'<div class="image-name">📄 {current_image_name}</div>', unsafe_allow_html=True)
+    
+    # Prefetch upcoming slides (and the previous one) so navigation doesn't wait on Drive
+    if total_images > 1:
+        neighbor_urls = dict.fromkeys(
+            images[(st.session_state.current_index + step) % total_images]['url']
+            for step in (*range(1, PRELOAD_AHEAD + 1), -1)
+        )
+        neighbor_urls.pop(current_image_url, None)
+        st.markdown(
+            "".join(f'<link rel="preload" as="image" href="{url}">' for url in neighbor_urls),
+            unsafe_allow_html=True
+        )
+    
+    # Status info
+    info_col1, info_col2, info_col3 = st.columns(3)
+    
+    with info_col1:
+        status = "▶️ Auto-playing" if st.session_state.auto_play else "⏸️ Paused"
+        st.info(status)
+    
+    with info_col2:
+        st.info(f"⏱️ {slide_interval}s interval")
+    
+    with info_col3:
+        st.info(f"🔄 Loop: {'On' if auto_loop else 'Off'}")
 
-# Auto-advance logic
-if st.session_state.auto_play:
-    time.sleep(slide_interval)
-    if auto_loop:
-        st.session_state.current_index = (st.session_state.current_index + 1) % total_images
-    else:
-        # Stop at the end if loop is off
-        if st.session_state.current_index < total_images - 1:
-            st.session_state.current_index += 1
-        else:
-            st.session_state.auto_play = False
-    st.rerun()
+slideshow()